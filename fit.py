@@ -1,8 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from io import BytesIO
 from struct import pack
-from struct import unpack
+from struct import Struct
 from datetime import datetime
 import time
 
@@ -21,6 +20,61 @@ def _calcCRC(crc, byte):
     return crc
 
 
+# byte-wise CRC table, derived once from the nibble algorithm above so the
+# hot loop needs a single lookup per byte instead of two nibble passes
+CRC_TABLE = tuple(_calcCRC(0, byte) for byte in range(256))
+
+
+def _build_crc_tables():
+    """slice-by-8 tables: T[k][i] is the CRC of byte i followed by k zero bytes"""
+    tables = [list(CRC_TABLE)]
+    for k in range(1, 8):
+        prev = tables[k - 1]
+        tables.append([(prev[i] >> 8) ^ CRC_TABLE[prev[i] & 0xFF] for i in range(256)])
+    return tuple(tuple(t) for t in tables)
+
+CRC_TABLES = _build_crc_tables()
+
+
+try:
+    # optional accelerator: native slice-by-8 CRC (python setup.py build_ext --inplace)
+    from _fitcrc import crc16 as _crc16_ext
+except ImportError:
+    _crc16_ext = None
+
+try:
+    # optional accelerator: JIT-compiled CRC loop when numba is installed
+    import numpy
+    from numba import njit
+except ImportError:
+    njit = None
+else:
+    _CRC_TABLE_NUMPY = numpy.asarray(CRC_TABLE, dtype=numpy.uint16)
+
+    @njit(cache=True, boundscheck=False)
+    def _crc16_jit(data, table, crc):
+        for b in data:
+            crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+        return crc
+
+
+def _crc16(data, crc=0):
+    """CRC-16 over a bytes-like object, eight bytes per loop iteration"""
+    if _crc16_ext is not None:
+        return _crc16_ext(data, crc)
+    if njit is not None:
+        return int(_crc16_jit(numpy.frombuffer(data, dtype=numpy.uint8), _CRC_TABLE_NUMPY, crc))
+    t0, t1, t2, t3, t4, t5, t6, t7 = CRC_TABLES
+    n = len(data) - len(data) % 8
+    for i in range(0, n, 8):
+        b0, b1, b2, b3, b4, b5, b6, b7 = data[i:i + 8]
+        crc = (t7[b0 ^ (crc & 0xFF)] ^ t6[b1 ^ (crc >> 8)] ^
+               t5[b2] ^ t4[b3] ^ t3[b4] ^ t2[b5] ^ t1[b6] ^ t0[b7])
+    for b in data[n:]:
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ b) & 0xFF]
+    return crc
+
+
 class FitBaseType(object):
     """BaseType Definition
 
@@ -57,6 +111,68 @@ class FitBaseType(object):
         return pack(fmt, value)
 
 
+# static message layouts: (field number, base type, scale)
+_FILE_INFO_FIELDS = (
+    (3, FitBaseType.uint32z, None),   # serial_number
+    (4, FitBaseType.uint32, None),    # time_created
+    (1, FitBaseType.uint16, None),    # manufacturer
+    (2, FitBaseType.uint16, None),    # product
+    (5, FitBaseType.uint16, None),    # number
+    (0, FitBaseType.enum, None),      # type
+)
+_FILE_CREATOR_FIELDS = (
+    (0, FitBaseType.uint16, None),    # software_version
+    (1, FitBaseType.uint8, None),     # hardware_version
+)
+_DEVICE_INFO_FIELDS = (
+    (253, FitBaseType.uint32, 1),     # timestamp
+    (3, FitBaseType.uint32z, 1),      # serial_number
+    (7, FitBaseType.uint32, 1),       # cum_operating_time
+    (8, FitBaseType.uint32, None),    # unknown field(undocumented)
+    (2, FitBaseType.uint16, 1),       # manufacturer
+    (4, FitBaseType.uint16, 1),       # product
+    (5, FitBaseType.uint16, 100),     # software_version
+    (10, FitBaseType.uint16, 256),    # battery_voltage
+    (0, FitBaseType.uint8, 1),        # device_index
+    (1, FitBaseType.uint8, 1),        # device_type
+    (6, FitBaseType.uint8, 1),        # hardware_version
+    (11, FitBaseType.uint8, None),    # battery_status
+)
+_WEIGHT_SCALE_FIELDS = (
+    (253, FitBaseType.uint32, 1),     # timestamp
+    (0, FitBaseType.uint16, 100),     # weight
+    (1, FitBaseType.uint16, 100),     # percent_fat
+    (2, FitBaseType.uint16, 100),     # percent_hydration
+    (3, FitBaseType.uint16, 100),     # visceral_fat_mass
+    (4, FitBaseType.uint16, 100),     # bone_mass
+    (5, FitBaseType.uint16, 100),     # muscle_mass
+    (7, FitBaseType.uint16, 4),       # basal_met
+    (9, FitBaseType.uint16, 4),       # active_met
+    (8, FitBaseType.uint8, 1),        # physique_rating
+    (10, FitBaseType.uint8, 1),       # metabolic_age
+    (11, FitBaseType.uint8, 1),       # visceral_fat_rating
+)
+
+
+def _field_defs(fields):
+    """packed field-definition triples (number, size, base type) of a message"""
+    return b''.join(pack('BBB', num, basetype['size'], basetype['field'])
+                    for num, basetype, scale in fields)
+
+
+def _value_struct(fields):
+    """one precompiled Struct covering every field value of a message"""
+    return Struct('<' + ''.join(FitBaseType.get_format(basetype)
+                                for num, basetype, scale in fields))
+
+
+def _definition_bytes(lmsg_type, gmsg_num, fields):
+    """complete definition message: record header, fixed content, field defs"""
+    # 0x40: definition record; reserved, architecture(0: little endian)
+    fixed_content = pack('<BBBHB', 0x40 | lmsg_type, 0, 0, gmsg_num, len(fields))
+    return fixed_content + _field_defs(fields)
+
+
 class Fit(object):
     HEADER_SIZE = 12
 
@@ -73,7 +189,9 @@ class FitEncoder(Fit):
         """the timestamp in fit protocol is seconds since
         UTC 00:00 Dec 31 1989 (631065600)"""
         if isinstance(t, datetime):
-            t = time.mktime(t.timetuple())
+            # datetime.timestamp() skips the timetuple/mktime round-trip;
+            # the hot path passes epoch ints and never takes this branch
+            t = t.timestamp()
         return t - 631065600
 
 
@@ -84,188 +202,175 @@ class FitEncoder_Weight(FitEncoder):
     LMSG_TYPE_DEVICE_INFO = 2
     LMSG_TYPE_WEIGHT_SCALE = 3
 
+    _FILE_INFO_STRUCT = _value_struct(_FILE_INFO_FIELDS)
+    _FILE_CREATOR_STRUCT = _value_struct(_FILE_CREATOR_FIELDS)
+    _DEVICE_INFO_STRUCT = _value_struct(_DEVICE_INFO_FIELDS)
+    _WEIGHT_SCALE_STRUCT = _value_struct(_WEIGHT_SCALE_FIELDS)
+
+    # definition messages are fully static, pack them once here
+    _FILE_INFO_DEF = _definition_bytes(LMSG_TYPE_FILE_INFO, Fit.GMSG_NUMS['file_id'], _FILE_INFO_FIELDS)
+    _FILE_CREATOR_DEF = _definition_bytes(LMSG_TYPE_FILE_CREATOR, Fit.GMSG_NUMS['file_creator'], _FILE_CREATOR_FIELDS)
+    _DEVICE_INFO_DEF = _definition_bytes(LMSG_TYPE_DEVICE_INFO, Fit.GMSG_NUMS['device_info'], _DEVICE_INFO_FIELDS)
+    _WEIGHT_SCALE_DEF = _definition_bytes(LMSG_TYPE_WEIGHT_SCALE, Fit.GMSG_NUMS['weight_scale'], _WEIGHT_SCALE_FIELDS)
+
+    _HEADER_STRUCT = Struct('<BBHI4s')
+
     def __init__(self):
-        self.buf = BytesIO()
+        self.buf = bytearray(4096)
+        self.pos = 0
         self.write_header()  # create header first
         self.device_info_defined = False
         self.weight_scale_defined = False
 
     def __str__(self):
-        orig_pos = self.buf.tell()
-        self.buf.seek(0)
         lines = []
-        while True:
-            b = self.buf.read(16)
-            if not b:
-                break
-            lines.append(' '.join(['%02x' % ord(c) for c in b]))
-        self.buf.seek(orig_pos)
+        for offset in range(0, self.pos, 16):
+            chunk = self.buf[offset:min(offset + 16, self.pos)]
+            lines.append(' '.join(['%02x' % b for b in chunk]))
         return '\n'.join(lines)
 
+    def _ensure(self, n):
+        """grow the buffer geometrically so n more bytes fit at self.pos"""
+        needed = self.pos + n
+        capacity = len(self.buf)
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            self.buf.extend(b'\0' * (capacity - len(self.buf)))
+
+    def _write(self, data):
+        self._ensure(len(data))
+        self.buf[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+
     def write_header(self, header_size=Fit.HEADER_SIZE,
                      protocol_version=16,
                      profile_version=108,
                      data_size=0,
                      data_type=b'.FIT'):
-        self.buf.seek(0)
-        s = pack('BBHI4s', header_size, protocol_version, profile_version, data_size, data_type)
-        self.buf.write(s)
+        self._HEADER_STRUCT.pack_into(self.buf, 0, header_size, protocol_version, profile_version, data_size, data_type)
+        if self.pos < self.HEADER_SIZE:
+            self.pos = self.HEADER_SIZE
 
-    def _build_content_block(self, content):
-        field_defs = []
+    def _write_values(self, lmsg_type, fields, value_struct, raw_values):
         values = []
-        for num, basetype, value, scale in content:
-            s = pack('BBB', num, basetype['size'], basetype['field'])
-            field_defs.append(s)
+        for (num, basetype, scale), value in zip(fields, raw_values):
             if value is None:
                 # invalid value
                 value = basetype['invalid']
-            elif scale is not None:
-                value *= scale
-            values.append(FitBaseType.pack(basetype, value))
-        return (b''.join(field_defs), b''.join(values))
+            else:
+                if scale is not None:
+                    value *= scale
+                if basetype['#'] in (1, 2, 3, 4, 5, 6, 10, 11, 12):
+                    value = int(value)
+            values.append(value)
+        self._ensure(1 + value_struct.size)
+        self.buf[self.pos] = lmsg_type  # data record header
+        value_struct.pack_into(self.buf, self.pos + 1, *values)
+        self.pos += 1 + value_struct.size
 
     def write_file_info(self, serial_number=None, time_created=None, manufacturer=None, product=None, number=None):
         if time_created is None:
-            time_created = datetime.now()
-
-        content = [
-            (3, FitBaseType.uint32z, serial_number, None),
-            (4, FitBaseType.uint32, self.timestamp(time_created), None),
-            (1, FitBaseType.uint16, manufacturer, None),
-            (2, FitBaseType.uint16, product, None),
-            (5, FitBaseType.uint16, number, None),
-            (0, FitBaseType.enum, self.FILE_TYPE, None), # type
-        ]
-        fields, values = self._build_content_block(content)
-
-        # create fixed content
-        msg_number = self.GMSG_NUMS['file_id']
-        fixed_content = pack('BBHB', 0, 0, msg_number, len(content))  # reserved, architecture(0: little endian)
-
-        self.buf.write(b''.join([
-            # definition
-            self.record_header(definition=True, lmsg_type=self.LMSG_TYPE_FILE_INFO),
-            fixed_content,
-            fields,
-            #record
-            self.record_header(lmsg_type=self.LMSG_TYPE_FILE_INFO),
-            values,
-        ]))
-
+            # epoch seconds directly, no datetime object and no conversion
+            # round-trip in timestamp()
+            time_created = time.time()
+
+        self._write(self._FILE_INFO_DEF)
+        self._write_values(self.LMSG_TYPE_FILE_INFO, _FILE_INFO_FIELDS, self._FILE_INFO_STRUCT, (
+            serial_number,
+            self.timestamp(time_created),
+            manufacturer,
+            product,
+            number,
+            self.FILE_TYPE,
+        ))
 
     def write_file_creator(self, software_version=None, hardware_version=None):
-        content = [
-            (0, FitBaseType.uint16, software_version, None),
-            (1, FitBaseType.uint8, hardware_version, None),
-        ]
-        fields, values = self._build_content_block(content)
-
-        msg_number = self.GMSG_NUMS['file_creator']
-        fixed_content = pack('BBHB', 0, 0, msg_number, len(content))  # reserved, architecture(0: little endian)
-        self.buf.write(b''.join([
-            # definition
-            self.record_header(definition=True, lmsg_type=self.LMSG_TYPE_FILE_CREATOR),
-            fixed_content,
-            fields,
-            #record
-            self.record_header(lmsg_type=self.LMSG_TYPE_FILE_CREATOR),
-            values,
-        ]))
+        self._write(self._FILE_CREATOR_DEF)
+        self._write_values(self.LMSG_TYPE_FILE_CREATOR, _FILE_CREATOR_FIELDS, self._FILE_CREATOR_STRUCT, (
+            software_version,
+            hardware_version,
+        ))
 
     def write_device_info(self, timestamp, serial_number=None, cum_operationg_time=None, manufacturer=None,
                           product=None, software_version=None, battery_voltage=None, device_index=None,
                           device_type=None, hardware_version=None, battery_status=None):
-        content = [
-            (253, FitBaseType.uint32, self.timestamp(timestamp), 1),
-            (3, FitBaseType.uint32z, serial_number, 1),
-            (7, FitBaseType.uint32, cum_operationg_time, 1),
-            (8, FitBaseType.uint32, None, None),  # unknown field(undocumented)
-            (2, FitBaseType.uint16, manufacturer, 1),
-            (4, FitBaseType.uint16, product, 1),
-            (5, FitBaseType.uint16, software_version, 100),
-            (10, FitBaseType.uint16, battery_voltage, 256),
-            (0, FitBaseType.uint8, device_index, 1),
-            (1, FitBaseType.uint8, device_type, 1),
-            (6, FitBaseType.uint8, hardware_version, 1),
-            (11, FitBaseType.uint8, battery_status, None),
-        ]
-        fields, values = self._build_content_block(content)
-
         if not self.device_info_defined:
-            header = self.record_header(definition=True, lmsg_type=self.LMSG_TYPE_DEVICE_INFO)
-            msg_number = self.GMSG_NUMS['device_info']
-            fixed_content = pack('BBHB', 0, 0, msg_number, len(content))  # reserved, architecture(0: little endian)
-            self.buf.write(header + fixed_content + fields)
+            self._write(self._DEVICE_INFO_DEF)
             self.device_info_defined = True
 
-        header = self.record_header(lmsg_type=self.LMSG_TYPE_DEVICE_INFO)
-        self.buf.write(header + values)
+        # None-to-invalid and scaling inlined; layout in _DEVICE_INFO_FIELDS
+        struct_ = self._DEVICE_INFO_STRUCT
+        self._ensure(1 + struct_.size)
+        self.buf[self.pos] = self.LMSG_TYPE_DEVICE_INFO  # data record header
+        struct_.pack_into(
+            self.buf, self.pos + 1,
+            int(self.timestamp(timestamp)),
+            int(serial_number) if serial_number is not None else 0x00000000,
+            int(cum_operationg_time) if cum_operationg_time is not None else 0xFFFFFFFF,
+            0xFFFFFFFF,  # unknown field(undocumented)
+            int(manufacturer) if manufacturer is not None else 0xFFFF,
+            int(product) if product is not None else 0xFFFF,
+            int(software_version * 100) if software_version is not None else 0xFFFF,
+            int(battery_voltage * 256) if battery_voltage is not None else 0xFFFF,
+            int(device_index) if device_index is not None else 0xFF,
+            int(device_type) if device_type is not None else 0xFF,
+            int(hardware_version) if hardware_version is not None else 0xFF,
+            int(battery_status) if battery_status is not None else 0xFF,
+        )
+        self.pos += 1 + struct_.size
 
     def write_weight_scale(self, timestamp, weight, percent_fat=None, percent_hydration=None,
                            visceral_fat_mass=None, bone_mass=None, muscle_mass=None, basal_met=None,
                            active_met=None, physique_rating=None, metabolic_age=None, visceral_fat_rating=None):
-        content = [
-            (253, FitBaseType.uint32, self.timestamp(timestamp), 1),
-            (0, FitBaseType.uint16, weight, 100),
-            (1, FitBaseType.uint16, percent_fat, 100),
-            (2, FitBaseType.uint16, percent_hydration, 100),
-            (3, FitBaseType.uint16, visceral_fat_mass, 100),
-            (4, FitBaseType.uint16, bone_mass, 100),
-            (5, FitBaseType.uint16, muscle_mass, 100),
-            (7, FitBaseType.uint16, basal_met, 4),
-            (9, FitBaseType.uint16, active_met, 4),
-            (8, FitBaseType.uint8, physique_rating, 1),
-            (10, FitBaseType.uint8, metabolic_age, 1),
-            (11, FitBaseType.uint8, visceral_fat_rating, 1),
-        ]
-        fields, values = self._build_content_block(content)
-
         if not self.weight_scale_defined:
-            header = self.record_header(definition=True, lmsg_type=self.LMSG_TYPE_WEIGHT_SCALE)
-            msg_number = self.GMSG_NUMS['weight_scale']
-            fixed_content = pack('BBHB', 0, 0, msg_number, len(content))  # reserved, architecture(0: little endian)
-            self.buf.write(header + fixed_content + fields)
+            self._write(self._WEIGHT_SCALE_DEF)
             self.weight_scale_defined = True
 
-        header = self.record_header(lmsg_type=self.LMSG_TYPE_WEIGHT_SCALE)
-        self.buf.write(header + values)
+        # None-to-invalid and scaling inlined; layout in _WEIGHT_SCALE_FIELDS
+        struct_ = self._WEIGHT_SCALE_STRUCT
+        self._ensure(1 + struct_.size)
+        self.buf[self.pos] = self.LMSG_TYPE_WEIGHT_SCALE  # data record header
+        struct_.pack_into(
+            self.buf, self.pos + 1,
+            int(self.timestamp(timestamp)),
+            int(weight * 100) if weight is not None else 0xFFFF,
+            int(percent_fat * 100) if percent_fat is not None else 0xFFFF,
+            int(percent_hydration * 100) if percent_hydration is not None else 0xFFFF,
+            int(visceral_fat_mass * 100) if visceral_fat_mass is not None else 0xFFFF,
+            int(bone_mass * 100) if bone_mass is not None else 0xFFFF,
+            int(muscle_mass * 100) if muscle_mass is not None else 0xFFFF,
+            int(basal_met * 4) if basal_met is not None else 0xFFFF,
+            int(active_met * 4) if active_met is not None else 0xFFFF,
+            int(physique_rating) if physique_rating is not None else 0xFF,
+            int(metabolic_age) if metabolic_age is not None else 0xFF,
+            int(visceral_fat_rating) if visceral_fat_rating is not None else 0xFF,
+        )
+        self.pos += 1 + struct_.size
 
     def record_header(self, definition=False, lmsg_type=0):
         msg = 0
         if definition:
             msg = 1 << 6  # 6th bit is a definition message
-        return pack('B', msg + lmsg_type)
+        return bytes((msg + lmsg_type,))
 
     def crc(self):
-        orig_pos = self.buf.tell()
-        self.buf.seek(0)
-
-        crc = 0
-        while(True):
-            b = self.buf.read(1)
-            if not b:
-                break
-            crc = _calcCRC(crc, unpack('b', b)[0])
-        self.buf.seek(orig_pos)
-        return pack('H', crc)
+        return pack('H', _crc16(memoryview(self.buf)[:self.pos]))
 
     def finish(self):
         """re-weite file-header, then append crc to end of file"""
         data_size = self.get_size() - self.HEADER_SIZE
         self.write_header(data_size=data_size)
-        crc = self.crc()
-        self.buf.seek(0, 2)
-        self.buf.write(crc)
+        self._write(self.crc())
         print ('fit finish OK')
 
     def get_size(self):
-        orig_pos = self.buf.tell()
-        self.buf.seek(0, 2)
-        size = self.buf.tell()
-        self.buf.seek(orig_pos)
-        return size
+        return self.pos
 
     def getvalue(self):
-        return self.buf.getvalue()
+        return bytes(self.buf[:self.pos])
+
+    def getbuffer(self):
+        """view of the encoded file without copying the buffer"""
+        return memoryview(self.buf)[:self.pos]
 
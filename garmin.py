@@ -22,6 +22,12 @@ class GarminConnect(object):
     LOGIN_URL = 'https://connect.garmin.com/signin'
     UPLOAD_URL = 'https://connect.garmin.com/modern/proxy/upload-service/upload/.fit'
 
+    REQUEST_HEADERS = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36',
+            "Referer": "https://jhartman.pl",
+            'origin': 'https://sso.garmin.com'
+        }
+
     _sessionCache = SessionCache(lifetime=timedelta(minutes=30), freshen_on_get=True)
 
     def create_opener(self, cookie):
@@ -71,11 +77,7 @@ class GarminConnect(object):
             # "locale": "en"
         }
 
-        headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36',
-                "Referer": "https://jhartman.pl",
-                'origin': 'https://sso.garmin.com'
-            }
+        headers = self.REQUEST_HEADERS
 
         # I may never understand what motivates people to mangle a perfectly good protocol like HTTP in the ways they do...
         preResp = session.get("https://sso.garmin.com/sso/signin", params=params, headers=headers)
@@ -141,9 +143,21 @@ class GarminConnect(object):
             for key, value in list(cookies.items()):
                 print("Key: " + key + ", " + value)
 
+    def _session_from_cache(self, email):
+        """rebuild a session from cached cookies, skipping the SSO dance"""
+        cookies = self._sessionCache.Get(email)
+        if cookies is None:
+            return None
+        session = requests.Session()
+        session.cookies = cookies
+        session.headers.update(self.REQUEST_HEADERS)
+        return session
+
     def login(self, username, password):
         print(username)
-        session = self._get_session(email=username, password=password)
+        session = self._session_from_cache(username)
+        if session is None:
+            session = self._get_session(email=username, password=password)
 
         try:
             dashboard = session.get("http://connect.garmin.com/modern")
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# Builds the optional _fitcrc C extension used by fit.py:
+#
+#   python setup.py build_ext --inplace
+#
+# The sync scripts work without it; fit.py falls back to pure Python.
+
+from setuptools import setup, Extension
+
+setup(
+    name='withings2garmin-fitcrc',
+    version='1.0',
+    ext_modules=[
+        Extension('_fitcrc', sources=['_fitcrcmodule.c'], extra_compile_args=['-O3']),
+    ],
+)
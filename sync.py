@@ -74,35 +74,46 @@ def sync(garmin_username, garmin_password, fromdate, todate, no_upload, verbose)
 
 	groups = withings.getMeasurements(startdate=startdate, enddate=enddate)
 
+	if not groups:
+		# nothing to encode or upload, no point logging in to Garmin
+		print("No measurements to sync, try to use --fromdate and --todate")
+		return
+
 	# create fit file
 	verbose_print('generating fit file...\n')
 	fit = FitEncoder_Weight()
 	fit.write_file_info()
 	fit.write_file_creator()
 
+	# one device_info record describes the whole file, no need to repeat it
+	# for every measurement
+	fit.write_device_info(timestamp=groups[0].date)
+
 	for group in groups:
 		# get extra physical measurements
-		dt = group.get_datetime()
 		weight = group.get_weight()
 		fat_ratio = group.get_fat_ratio()
 		muscle_mass = group.get_muscle_mass()
 		hydration = group.get_hydration()
 		bone_mass = group.get_bone_mass()
 
-		fit.write_device_info(timestamp=dt)
+		# group.date is already epoch seconds, no need for the
+		# datetime -> timetuple -> mktime round-trip per record
 		fit.write_weight_scale(
-			timestamp=dt,
+			timestamp=group.date,
 			weight=weight,
 			percent_fat=fat_ratio,
 			percent_hydration=(hydration * 100.0 / weight) if (hydration and weight) else None,
 			bone_mass=bone_mass,
 			muscle_mass=muscle_mass
 		)
-		verbose_print('appending weight scale record... %s %skg %s%%\n' % (dt, weight, fat_ratio))
+		if verbose:
+			# only build the datetime and the log line when they are shown
+			verbose_print('appending weight scale record... %s %skg %s%%\n' % (group.get_datetime(), weight, fat_ratio))
 	fit.finish()
 
 	if no_upload:
-		sys.stdout.buffer.write(fit.getvalue())
+		sys.stdout.buffer.write(fit.getbuffer())
 		return
 
 	# DEBUG: test.fit contain data from Withings Healthmate
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import requests
 import json
@@ -7,8 +8,40 @@ import argparse
 
 from datetime import date
 from datetime import datetime
+from urllib.parse import urlencode
 import time
 
+try:
+	# optional: faster C decoder for API responses when installed
+	import orjson
+except ImportError:
+	orjson = None
+
+
+def _parse_json(response):
+	if orjson is not None:
+		return orjson.loads(response.content)
+	return response.json()
+
+
+def _post(session, url, params, headers=None):
+	"""POST returning parsed JSON, honouring Retry-After on 429/503
+
+	Raises requests.HTTPError on other error statuses instead of
+	failing later with a JSON decode error on an HTML error page."""
+	for attempt in range(3):
+		response = session.post(url, params=params, headers=headers)
+		if response.status_code in (429, 503) and attempt < 2:
+			try:
+				delay = int(response.headers.get('Retry-After', '1'))
+			except ValueError:
+				delay = 1
+			time.sleep(delay)
+			continue
+		response.raise_for_status()
+		return _parse_json(response)
+
+
 class WithingsException(Exception):
     pass
 
@@ -20,6 +53,9 @@ class Withings():
 	APP_CONFIG = 'config/withings_app.json'
 	USER_CONFIG = 'config/withings_user.json'
 
+# parsed config files keyed by path, with the mtime they were read at
+_config_cache = {}
+
 class WithingsConfig(Withings):
 	config = {}
 	config_file = ""
@@ -29,21 +65,45 @@ class WithingsConfig(Withings):
 		self.read()
 
 	def read(self):
+		try:
+			mtime = os.path.getmtime(self.config_file)
+		except OSError:
+			mtime = None
+		cached = _config_cache.get(self.config_file)
+		if cached is not None and cached[0] == mtime:
+			self.config = cached[1]
+			self._snapshot = dict(self.config)
+			return
 		try:
 			with open(self.config_file) as f:
 				self.config = json.load(f)
 		except (ValueError, FileNotFoundError):
 			print("Can't read config file " + self.config_file)
 			self.config = {}
+		_config_cache[self.config_file] = (mtime, self.config)
+		self._snapshot = dict(self.config)
 
 	def write(self):
-		with open(self.config_file, "w") as f:
+		if getattr(self, '_snapshot', None) == self.config:
+			# nothing changed since read, skip the disk write
+			return
+		# write-then-replace so a crash can't leave a truncated config,
+		# which would force the user through a full re-auth
+		tmp_file = self.config_file + ".tmp"
+		with open(tmp_file, "w") as f:
 			json.dump(self.config, f, indent=4, sort_keys=True)
+		os.replace(tmp_file, self.config_file)
+		_config_cache[self.config_file] = (os.path.getmtime(self.config_file), self.config)
+		self._snapshot = dict(self.config)
 
 class WithingsOAuth2(Withings):
 	app_config = user_config = None
 
 	def __init__(self):
+		# one keep-alive session for every Withings call, so only the first
+		# request pays the TLS handshake
+		self.session = requests.Session()
+
 		app_cfg = WithingsConfig(Withings.APP_CONFIG)
 		self.app_config = app_cfg.config
 
@@ -55,8 +115,10 @@ class WithingsOAuth2(Withings):
 				self.user_config['authentification_code'] = self.getAuthenticationCode()
 
 			self.getAccessToken()
-
-		self.refreshAccessToken()
+		elif time.time() >= self.user_config.get('expires_at', 0) - 60:
+			# only hit the token endpoint when the stored access token is
+			# expired (or about to); a valid one saves the round trip
+			self.refreshAccessToken()
 
 		app_cfg.write()
 		user_cfg.write()
@@ -80,10 +142,8 @@ class WithingsOAuth2(Withings):
 		print("(This is one-time activity)")
 		print()
 		
-		url = Withings.AUTHORIZE_URL + '?'
-
-		for key, value in params.items():
-			url = url + key + '=' + value + "&"
+		# urlencode percent-escapes the redirect_uri and scope properly
+		url = Withings.AUTHORIZE_URL + '?' + urlencode(params)
 
 		print(url)
 		print()
@@ -104,9 +164,7 @@ class WithingsOAuth2(Withings):
 			"redirect_uri" : self.app_config['callback_url'],
 		}
 
-		req = requests.post(Withings.TOKEN_URL, params )
-
-		accessToken = req.json()
+		accessToken = _post(self.session, Withings.TOKEN_URL, params)
 
 		#print('status='+str(accessToken.get('status')))
 		#print(accessToken)
@@ -129,6 +187,7 @@ class WithingsOAuth2(Withings):
 			self.user_config['access_token'] = accessToken['body']['access_token']
 			self.user_config['refresh_token'] = accessToken['body']['refresh_token']
 			self.user_config['userid'] = accessToken['body']['userid']
+			self.user_config['expires_at'] = int(time.time()) + int(accessToken['body'].get('expires_in', 0))
 
 	def refreshAccessToken(self):
 		print("Withings: Refresh Access Token")
@@ -141,9 +200,7 @@ class WithingsOAuth2(Withings):
 			"refresh_token" : self.user_config['refresh_token'],
 		}
 
-		req = requests.post(Withings.TOKEN_URL, params )
-
-		accessToken = req.json()
+		accessToken = _post(self.session, Withings.TOKEN_URL, params)
 
 		if (accessToken.get('status') != 0) :
 			if(accessToken.get('error')):
@@ -161,6 +218,7 @@ class WithingsOAuth2(Withings):
 			self.user_config['access_token'] = accessToken['body']['access_token']
 			self.user_config['refresh_token'] = accessToken['body']['refresh_token']
 			self.user_config['userid'] = accessToken['body']['userid']
+			self.user_config['expires_at'] = int(time.time()) + int(accessToken['body'].get('expires_in', 0))
 
 class WithingsAccount(Withings):
 	def __init__(self):
@@ -180,15 +238,25 @@ class WithingsAccount(Withings):
 		}
 		headers = {'Authorization': 'Bearer ' + self.withings.user_config['access_token']}
 
-		req = requests.post(Withings.GETMEAS_URL, params=params ,headers=headers)
+		groups = []
+		while True:
+			measurements = _post(self.withings.session, Withings.GETMEAS_URL, params, headers)
+			#print(measurements)
 
-		measurements = req.json()
-		#print(measurements)
+			if measurements.get('status') != 0:
+				return
 
-		if measurements.get('status') == 0:
-			print("   Measurements received")
+			body = measurements.get('body')
+			groups.extend(WithingsMeasureGroup(g) for g in body.get('measuregrps'))
 
-			return [WithingsMeasureGroup(g) for g in measurements.get('body').get('measuregrps')]
+			# the API truncates large responses and sets more/offset;
+			# keep requesting until the range is complete
+			if not body.get('more'):
+				break
+			params['offset'] = body.get('offset')
+
+		print("   Measurements received")
+		return groups
 
 class WithingsMeasureGroup(object):
     def __init__(self, measuregrp):
@@ -198,6 +266,7 @@ class WithingsMeasureGroup(object):
         self.date = measuregrp.get('date')
         self.category = measuregrp.get('category')
         self.measures = [WithingsMeasure(m) for m in measuregrp['measures']]
+        self._values_by_type = None
 
     def __iter__(self):
         for measure in self.measures:
@@ -209,40 +278,39 @@ class WithingsMeasureGroup(object):
     def get_datetime(self):
         return datetime.fromtimestamp(self.date)
 
+    def _get_value(self, measure_type):
+        """value of the first measure of the given type, None if absent"""
+        if self._values_by_type is None:
+            # one scan of the measures instead of one per get_* helper
+            values = {}
+            for measure in self.measures:
+                values.setdefault(measure.type, measure.get_value())
+            self._values_by_type = values
+        return self._values_by_type.get(measure_type)
+
     def get_weight(self):
         """convinient function to get weight"""
-        for measure in self.measures:
-            if measure.type == WithingsMeasure.TYPE_WEIGHT:
-                return measure.get_value()
-        return None
+        return self._get_value(WithingsMeasure.TYPE_WEIGHT)
 
     def get_fat_ratio(self):
         """convinient function to get fat ratio"""
-        for measure in self.measures:
-            if measure.type == WithingsMeasure.TYPE_FAT_RATIO:
-                return measure.get_value()
-        return None
+        return self._get_value(WithingsMeasure.TYPE_FAT_RATIO)
 
     def get_muscle_mass(self):
         """convinient function to get muscle mass"""
-        for measure in self.measures:
-            if measure.type == WithingsMeasure.TYPE_MUSCLE_MASS:
-                return measure.get_value()
-        return None
+        return self._get_value(WithingsMeasure.TYPE_MUSCLE_MASS)
 
     def get_hydration(self):
         """convinient function to get hydration"""
-        for measure in self.measures:
-            if measure.type == WithingsMeasure.TYPE_HYDRATION:
-                return measure.get_value()
-        return None
+        return self._get_value(WithingsMeasure.TYPE_HYDRATION)
 
     def get_bone_mass(self):
         """convinient function to get bone mass"""
-        for measure in self.measures:
-            if measure.type == WithingsMeasure.TYPE_BONE_MASS:
-                return measure.get_value()
-        return None
+        return self._get_value(WithingsMeasure.TYPE_BONE_MASS)
+
+# Withings 'unit' is a small signed decimal exponent; precompute the scales
+# so get_value() is a dict lookup instead of a pow() per measure
+_POW10 = {e: 10 ** e for e in range(-9, 4)}
 
 class WithingsMeasure(object):
     TYPE_WEIGHT = 1
@@ -281,5 +349,8 @@ class WithingsMeasure(object):
         return '%s: %s %s' % (type_s, self.get_value(), unit_s)
 
     def get_value(self):
-        return self.value * pow(10, self.unit)
+        scale = _POW10.get(self.unit)
+        if scale is None:
+            scale = pow(10, self.unit)
+        return self.value * scale
 